@@ -6,28 +6,69 @@ requirements.txt.
 
 Currently this only contains the PDFtoXLSXConverter class, which can
 convert the PDF ledger to an XLSX file using pdftoexcel.com or
-pdftoexcelconverter.net. It also contains ConversionTimeoutError and
-ConversionRejectedError which this class uses.
+pdftoexcelconverter.net, along with two functions that use it. The
+convert_racing() function runs both converters at once and uses
+whichever finishes first, and the convert_many() function converts
+several ledgers at once. The exceptions that these use are in
+custom_exceptions.py.
 """
 
 import json
 import logging
+import os
 import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests_toolbelt import MultipartEncoder
+from urllib3.util.retry import Retry
 
+from custom_exceptions import ConversionCancelledError, \
+    ConversionRejectedError, ConversionTimeoutError
 from ledger_fetcher import Ledger, CustomEncoder
 
 __author__ = "Christopher Menon"
 __credits__ = "Christopher Menon"
 __license__ = "gpl-3.0"
 
+LOGGER = logging.getLogger(__name__)
+
 # The number of PDF to XLSX converters in the PDFtoXLSXConverter class
 NUMBER_OF_CONVERTERS = 2
 
 # How long to wait for conversion (in seconds)
 CONVERSION_TIMEOUT = 120
 
+# How long to wait when connecting to and reading from the converters
+# (in seconds), so that a stalled request can't outlast a cancellation
+# or CONVERSION_TIMEOUT
+CONVERTER_TIMEOUT = (5, 30)
+
+# The most ledgers to convert at once in convert_many()
+MAX_CONCURRENT_CONVERSIONS = 8
+
+# The shortest and longest time to wait between checks of the
+# conversion status (in seconds)
+MIN_POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 8
+
+# How to retry failed requests to the converters. Only the status and
+# download requests are retried, as the upload isn't safe to repeat
+CONVERTER_RETRIES = Retry(total=3, backoff_factor=0.5,
+                          status_forcelist=(502, 503, 504),
+                          raise_on_status=False)
+
+# The session used to make all the requests to the converters, which is
+# shared so that connections are kept alive and pooled. The headers are
+# specific to each converter so they're sent with each request instead
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16,
+                                      max_retries=CONVERTER_RETRIES))
+
 
 class PDFToXLSXConverter:
     """Represents a PDF to XLSX converter."""
@@ -68,7 +109,7 @@ class PDFToXLSXConverter:
             headers["Accept"] = "*/*"
             headers["Origin"] = "https://www.pdftoexcel.com"
             headers["Referer"] = "https://www.pdftoexcel.com/"
-            self.files = {"Filedata": open(ledger.get_pdf_filepath(), "rb")}
+            self.file_field = "Filedata"
             self.status_url = "https://www.pdftoexcel.com/status"
             self.download_url = "https://www.pdftoexcel.com"
 
@@ -79,13 +120,16 @@ class PDFToXLSXConverter:
             headers["Accept"] = "application/json"
             headers["Origin"] = "https://www.pdftoexcelconverter.net"
             headers["Referer"] = "https://www.pdftoexcelconverter.net/"
-            self.files = {"file[0]": open(ledger.get_pdf_filepath(), "rb")}
+            self.file_field = "file[0]"
             self.status_url = "https://www.pdftoexcelconverter.net/getIsConverted.php"
             self.download_url = "https://www.pdftoexcelconverter.net"
 
-        # Create the session that'll be used to make all the requests
-        self.session = requests.Session()
-        self.session.headers.update(headers)
+        # The PDF is only opened when it's uploaded
+        self.pdf_filepath = ledger.get_pdf_filepath()
+
+        # Use the shared session, sending these headers with each request
+        self.session = SESSION
+        self.headers = headers
 
         self.log()
 
@@ -99,12 +143,21 @@ class PDFToXLSXConverter:
         :raises ConversionRejectedError: if server rejects the PDF
         """
 
-        response = self.session.post(url=self.request_url, files=self.files)
+        # Stream the PDF in the request body instead of reading it all
+        with open(self.pdf_filepath, "rb") as pdf_file:
+            encoder = MultipartEncoder(fields={
+                self.file_field: (os.path.basename(self.pdf_filepath),
+                                  pdf_file, "application/pdf")})
+            response = self.session.post(url=self.request_url, data=encoder,
+                                         headers={**self.headers,
+                                                  "Content-Type": encoder.content_type},
+                                         timeout=CONVERTER_TIMEOUT)
         if raise_for_status:
             response.raise_for_status()
-        if "jobId" not in response.json().keys():
+        data = response.json()
+        if "jobId" not in data:
             raise ConversionRejectedError(self.get_name())
-        return response.json()["jobId"]
+        return data["jobId"]
 
     def check_conversion_status(self, job_id: str,
                                 raise_for_status: bool = True) \
@@ -121,7 +174,9 @@ class PDFToXLSXConverter:
         """
 
         response = self.session.get(url=self.status_url,
-                                    params=(("jobId", job_id), ("rand", "16")))
+                                    params=(("jobId", job_id), ("rand", "16")),
+                                    headers=self.headers,
+                                    timeout=CONVERTER_TIMEOUT)
         if raise_for_status:
             response.raise_for_status()
         return response.json()["download_url"]
@@ -141,64 +196,164 @@ class PDFToXLSXConverter:
         """
 
         response = self.session.get(url=self.download_url + download_url,
-                                    params={"id": job_id})
+                                    params={"id": job_id},
+                                    headers=self.headers,
+                                    timeout=CONVERTER_TIMEOUT)
         if raise_for_status:
             response.raise_for_status()
         return response.content
 
-    def get_name(self) -> str:
-        """Return the name of the converter."""
-        return self.name
-
-    def log(self) -> None:
-        """Logs the object to the log."""
-
-        LOGGER.info(json.dumps(self.__dict__, cls=CustomEncoder))
+    def convert(self, cancelled: Optional[threading.Event] = None) -> bytes:
+        """Converts the ledger, waiting for the conversion to finish.
 
+        This uploads the PDF, checks the status of the conversion until
+        the download URL is ready, and then downloads the XLSX.
 
-class ConversionTimeoutError(Exception):
-    """Thrown when the PDF to XLSX conversion times out."""
-
-    def __init__(self, converter: str = None, timeout: int = None,
-                 message: str = None):
-        """Constructs the message using the converter and timeout.
-
-        :param converter: the name of the converter
-        :type converter: str, optional
-        :param timeout: time waited in seconds
-        :type timeout: int, optional
-        :param message: a custom message
-        :type message: str, optional
+        :param cancelled: set to stop the conversion early
+        :type cancelled: threading.Event, optional
+        :return: the XLSX file
+        :rtype: bytes
+        :raises HTTPError: if a bad HTTP status code is returned
+        :raises ConversionRejectedError: if server rejects the PDF
+        :raises ConversionTimeoutError: if the conversion takes too long
+        :raises ConversionCancelledError: if the conversion is cancelled
         """
 
-        if message is None and isinstance(converter, str) and \
-                isinstance(timeout, int):
-            self.message = "Waited %d seconds for file conversion from %s." \
-                           % (timeout, converter)
-        else:
-            self.message = message
-        super().__init__(self.message)
+        job_id = self.upload_pdf()
+        LOGGER.info("Uploaded the PDF to %s with job ID %s.",
+                    self.get_name(), job_id)
 
+        download_url = self.wait_for_conversion(job_id, cancelled)
+        return self.download_xlsx(job_id, download_url)
 
-class ConversionRejectedError(Exception):
-    """Thrown when the PDF to XLSX conversion is rejected."""
+    def wait_for_conversion(self, job_id: str,
+                            cancelled: Optional[threading.Event] = None) \
+            -> str:
+        """Waits for the conversion to finish and gets the download URL.
 
-    def __init__(self, converter: str = None, message: str = None):
-        """Constructs the message using the converter.
+        The status is checked with exponential backoff and decorrelated
+        jitter, so it's checked often at first and less often as the
+        wait goes on.
 
-        :param converter: the name of the converter
-        :type converter: str, optional
-        :param message: a custom message
-        :type message: str, optional
+        :param job_id: the ID of the conversion job
+        :type job_id: str
+        :param cancelled: set to stop waiting early
+        :type cancelled: threading.Event, optional
+        :return: the download URL
+        :rtype: str
+        :raises HTTPError: if a bad HTTP status code is returned
+        :raises ConversionTimeoutError: if the conversion takes too long
+        :raises ConversionCancelledError: if the conversion is cancelled
         """
 
-        if message is None and isinstance(converter, str):
-            self.message = "The request to convert the PDF to XLSX was " \
-                           "rejected by %s." % converter
-        else:
-            self.message = message
-        super().__init__(self.message)
+        if cancelled is None:
+            cancelled = threading.Event()
+
+        deadline = time.monotonic() + CONVERSION_TIMEOUT
+        delay = MIN_POLL_INTERVAL
+        download_url = self.check_conversion_status(job_id)
+        while download_url == "":
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ConversionTimeoutError(self.get_name(),
+                                             CONVERSION_TIMEOUT)
+            delay = min(MAX_POLL_INTERVAL,
+                        random.uniform(MIN_POLL_INTERVAL, delay * 3))
+
+            # Stop straight away if the conversion has been cancelled
+            if cancelled.wait(min(delay, remaining)):
+                raise ConversionCancelledError(self.get_name())
+            download_url = self.check_conversion_status(job_id)
+
+        if cancelled.is_set():
+            raise ConversionCancelledError(self.get_name())
+        LOGGER.info("%s has finished converting job %s.",
+                    self.get_name(), job_id)
+        return download_url
 
+    def get_name(self) -> str:
+        """Return the name of the converter."""
+        return self.name
+
+    def log(self) -> None:
+        """Logs the object to the log."""
+
+        if LOGGER.isEnabledFor(logging.INFO):
+            LOGGER.info(json.dumps(self.__dict__, cls=CustomEncoder))
+
+
+def convert_racing(ledger: Ledger) -> bytes:
+    """Converts the ledger with all the converters at once.
+
+    Every converter is started at the same time and the XLSX from the
+    first one to succeed is returned, so a slow or failed converter
+    doesn't hold up the conversion. The others are then cancelled, so
+    they stop at their next status check instead of running on until
+    they finish or time out.
+
+    :param ledger: the ledger to convert
+    :type ledger: Ledger
+    :return: the XLSX file
+    :rtype: bytes
+    :raises Exception: the last error raised, if every converter fails
+    """
+
+    cancelled = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=NUMBER_OF_CONVERTERS)
+    try:
+        futures = {executor.submit(PDFToXLSXConverter(ledger, number).convert,
+                                   cancelled):
+                       number for number in range(1, NUMBER_OF_CONVERTERS + 1)}
+        error = None
+        for future in as_completed(futures):
+            try:
+                return future.result()
+            except Exception as e:
+                LOGGER.exception("Converter %d failed.", futures[future])
+                error = e
+        raise error
+    finally:
+        cancelled.set()
+        executor.shutdown(wait=False)
+
+
+def convert_many(ledgers: List[Ledger]) -> Dict[Ledger, bytes]:
+    """Converts several ledgers at once.
+
+    Each ledger is converted by its own converter, chosen randomly,
+    and they all share the same session. If any conversion fails then
+    the others are cancelled, so that its error is raised straight away.
+
+    :param ledgers: the ledgers to convert
+    :type ledgers: List[Ledger]
+    :return: the XLSX file for each ledger
+    :rtype: Dict[Ledger, bytes]
+    :raises HTTPError: if a bad HTTP status code is returned
+    :raises ConversionRejectedError: if server rejects a PDF
+    :raises ConversionTimeoutError: if a conversion takes too long
+    """
+
+    results = {}
+    if not ledgers:
+        return results
+
+    cancelled = threading.Event()
+    workers = min(MAX_CONCURRENT_CONVERSIONS, len(ledgers))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(PDFToXLSXConverter(ledger).convert,
+                                   cancelled): ledger
+                   for ledger in ledgers}
+        try:
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                LOGGER.info("Converted %s.", futures[future].get_pdf_filename())
+
+        # Stop the other conversions, including any that haven't started
+        except Exception:
+            cancelled.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    return results
 
 if __name__ == "__main__":
 
@@ -207,7 +362,3 @@ if __name__ == "__main__":
                         filemode="a",
                         format="%(asctime)s | %(levelname)s : %(message)s",
                         level=logging.DEBUG)
-    LOGGER = logging.getLogger(__name__)
-
-else:
-    LOGGER = logging.getLogger(__name__)
@@ -0,0 +1,30 @@
+"""Caches the parsed config file used by the Python scripts.
+
+The load_config() function parses the config file and caches the
+result, keyed on the file's modification time. This means that the file
+is only read and parsed again if it has been edited.
+"""
+
+import configparser
+from functools import lru_cache
+
+__author__ = "Christopher Menon"
+__credits__ = "Christopher Menon"
+__license__ = "gpl-3.0"
+
+
+@lru_cache(maxsize=4)
+def load_config(path: str, mtime_ns: int) -> configparser.ConfigParser:
+    """Loads and parses the config file, caching the result.
+
+    :param path: the filepath of the config file
+    :type path: str
+    :param mtime_ns: the modification time of the file, in nanoseconds
+    :type mtime_ns: int
+    :return: the parsed config
+    :rtype: configparser.ConfigParser
+    """
+
+    parser = configparser.ConfigParser()
+    parser.read(path)
+    return parser
@@ -10,6 +10,11 @@ class AppsScriptApiError(Exception):
     pass
 
 
+class AuthorizationRequiredError(Exception):
+    """Thrown when the user needs to authorize access to Google."""
+    pass
+
+
 class XLSXDoesNotExistError(Exception):
     """Thrown when the XLSX file doesn't exist."""
     pass
@@ -28,3 +33,66 @@ class PDFIsNotSavedError(Exception):
 class XLSXIsNotSavedError(Exception):
     """Thrown when the XLSX file isn't saved."""
     pass
+
+
+class ConversionTimeoutError(Exception):
+    """Thrown when the PDF to XLSX conversion times out."""
+
+    def __init__(self, converter: str = None, timeout: int = None,
+                 message: str = None):
+        """Constructs the message using the converter and timeout.
+
+        :param converter: the name of the converter
+        :type converter: str, optional
+        :param timeout: time waited in seconds
+        :type timeout: int, optional
+        :param message: a custom message
+        :type message: str, optional
+        """
+
+        if message is None and isinstance(converter, str) and \
+                isinstance(timeout, int):
+            self.message = "Waited %d seconds for file conversion from %s." \
+                           % (timeout, converter)
+        else:
+            self.message = message
+        super().__init__(self.message)
+
+
+class ConversionRejectedError(Exception):
+    """Thrown when the PDF to XLSX conversion is rejected."""
+
+    def __init__(self, converter: str = None, message: str = None):
+        """Constructs the message using the converter.
+
+        :param converter: the name of the converter
+        :type converter: str, optional
+        :param message: a custom message
+        :type message: str, optional
+        """
+
+        if message is None and isinstance(converter, str):
+            self.message = "The request to convert the PDF to XLSX was " \
+                           "rejected by %s." % converter
+        else:
+            self.message = message
+        super().__init__(self.message)
+
+
+class ConversionCancelledError(Exception):
+    """Thrown when the PDF to XLSX conversion is cancelled."""
+
+    def __init__(self, converter: str = None, message: str = None):
+        """Constructs the message using the converter.
+
+        :param converter: the name of the converter
+        :type converter: str, optional
+        :param message: a custom message
+        :type message: str, optional
+        """
+
+        if message is None and isinstance(converter, str):
+            self.message = "The conversion by %s was cancelled." % converter
+        else:
+            self.message = message
+        super().__init__(self.message)
@@ -18,45 +18,48 @@ and a valid set of credentials (saved to config.ini and
 credentials.json respectively).
 
 This script relies on the classes in ledger_fetcher.py and
-custom_exceptions.py. It also relies on two Apps Scripts,
-ledger-comparison.gs and ledger-checker.gs, to neatly format the ledger
-and compare it to an older version. These should be created in an Apps
-Script project linked to the Google Sheet that the ledger is uploaded
-to. Finally, it relies on email-template.html to form the email.
+custom_exceptions.py, and the config loader in config_cache.py. It also
+relies on two Apps Scripts, ledger-comparison.gs and ledger-checker.gs,
+to neatly format the ledger and compare it to an older version. These
+should be created in an Apps Script project linked to the Google Sheet
+that the ledger is uploaded to. Finally, it relies on
+email-template.html and email-template.txt to form the email.
 """
 
+import atexit
 import configparser
+import copy
+import email.policy
 import email.utils
+import hashlib
 import imaplib
 import json
 import logging
 import os
 import pickle
-import re
 import smtplib
-import socket
 import ssl
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from email import encoders
-from email.mime.base import MIMEBase
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from typing import Optional
-
-import html2text
-import timeago
-from babel.numbers import format_currency
-from jinja2 import Environment, FileSystemLoader
-
-from custom_exceptions import AppsScriptApiError
+from email.message import EmailMessage
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
+
+from config_cache import load_config
+from custom_exceptions import AppsScriptApiError, AuthorizationRequiredError
 from ledger_fetcher import Ledger, CustomEncoder, authorize
 
+if TYPE_CHECKING:
+    import jinja2
+
 __author__ = "Christopher Menon"
 __credits__ = "Christopher Menon"
 __license__ = "gpl-3.0"
 
+LOGGER = logging.getLogger(__name__)
+
 # This is the number of consecutive failed attempts that the program
 # can make before it sends an error email
 ATTEMPTS = [3, 8, 15]
@@ -64,6 +67,22 @@ ATTEMPTS = [3, 8, 15]
 # The name of the config file
 CONFIG_FILENAME = "config.ini"
 
+# The size of the buffer used when writing the save file (in bytes)
+SAVE_BUFFER_SIZE = 1024 * 1024
+
+# The PDF ledgers in the save file are saved separately, in a folder
+# with this suffix next to the save file
+PDF_FOLDER_SUFFIX = ".pdfs"
+
+# The SMTP and IMAP connections, which are kept open and reused for
+# each email that's sent. They're keyed on the host, port, and username
+SMTP_CONNECTIONS = {}
+IMAP_CONNECTIONS = {}
+
+# How long to wait for a response from the SMTP and IMAP servers (in
+# seconds)
+EMAIL_TIMEOUT = 600
+
 
 class LedgerCheckerSaveFile:
     """Represents the save file used to maintain persistence."""
@@ -87,28 +106,140 @@ class LedgerCheckerSaveFile:
             if not isinstance(inst, LedgerCheckerSaveFile):
                 raise FileNotFoundError("The save data file is invalid.")
 
-        # If it fails then just initialise with blank values
+        # If it fails then just initialise with blank values and save them
         except (FileNotFoundError, EOFError):
 
             self.save_data_filepath = save_data_filepath
             self.stack_traces = []
+            self.error_count = 0
             self.changes = None
             self.most_recent_ledger = None
             self.changes_ledger = None
             self.error_email_id = None
             self.success_email_id = None
+            self.save_data()
 
-        self.save_data()
+        # Otherwise it's already saved so there's no need to save it again
+        else:
+            self.unsaved_changes = False
+            self.log()
 
     def save_data(self) -> None:
         """Save to the actual file."""
 
-        with open(self.save_data_filepath, "wb") as save_file:
-            pickle.dump(self, save_file)
-            save_file.close()
+        self.unsaved_changes = False
+        with open(self.save_data_filepath, "wb",
+                  buffering=SAVE_BUFFER_SIZE) as save_file:
+            pickle.dump(self, save_file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.delete_unused_pdf_files()
 
         self.log()
 
+    def save_unsaved_changes(self) -> None:
+        """Saves to the actual file, but only if anything has changed."""
+
+        if self.unsaved_changes:
+            self.save_data()
+
+    def __getstate__(self) -> dict:
+        """Gets the state to pickle, without the PDF ledgers.
+
+        The PDF in each ledger is saved to its own file (named after its
+        hash) and only the filepath is pickled, so the PDFs aren't
+        written again every time the save file is.
+
+        :return: the state to pickle
+        :rtype: dict
+        """
+
+        state = self.__dict__.copy()
+        state["pdf_filepaths"] = {}
+        copies = {}
+        for key in ("most_recent_ledger", "changes_ledger"):
+            ledger = state.get(key)
+            if ledger is None or not isinstance(ledger.pdf_file, bytes):
+                continue
+
+            # Both keys are often the same ledger, so only copy it once
+            if id(ledger) not in copies:
+                ledger_copy = copy.copy(ledger)
+                ledger_copy.pdf_file = None
+                copies[id(ledger)] = ledger_copy
+            state[key] = copies[id(ledger)]
+            state["pdf_filepaths"][key] = self.save_pdf_file(ledger.pdf_file)
+
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        """Restores the pickled state, loading the PDF ledgers.
+
+        :param state: the pickled state
+        :type state: dict
+        """
+
+        # Older save files have the PDFs in the ledgers instead, and
+        # kept every stack trace instead of counting the errors
+        pdf_filepaths = state.pop("pdf_filepaths", {})
+        state.setdefault("error_count", len(state.get("stack_traces", [])))
+        self.__dict__.update(state)
+        for key, pdf_filepath in pdf_filepaths.items():
+            try:
+                with open(pdf_filepath, "rb") as pdf_file:
+                    getattr(self, key).pdf_file = pdf_file.read()
+
+            # A ledger without its PDF can't be attached to an email,
+            # so it's dropped as if it had never been saved
+            except FileNotFoundError:
+                LOGGER.warning("The PDF ledger %s is missing, so the %s "
+                               "has been dropped.", pdf_filepath, key)
+                setattr(self, key, None)
+
+    def get_pdf_filepath(self, pdf_file: bytes) -> str:
+        """Gets the filepath that a PDF ledger is saved to.
+
+        :param pdf_file: the PDF ledger
+        :type pdf_file: bytes
+        :return: the filepath
+        :rtype: str
+        """
+
+        return os.path.join(self.save_data_filepath + PDF_FOLDER_SUFFIX,
+                            hashlib.sha256(pdf_file).hexdigest() + ".pdf")
+
+    def save_pdf_file(self, pdf_file: bytes) -> str:
+        """Saves a PDF ledger, unless it's already been saved.
+
+        :param pdf_file: the PDF ledger
+        :type pdf_file: bytes
+        :return: the filepath it's saved to
+        :rtype: str
+        """
+
+        pdf_filepath = self.get_pdf_filepath(pdf_file)
+        if not os.path.isfile(pdf_filepath):
+            os.makedirs(os.path.dirname(pdf_filepath), exist_ok=True)
+            with open(pdf_filepath + ".tmp", "wb") as file:
+                file.write(pdf_file)
+            os.replace(pdf_filepath + ".tmp", pdf_filepath)
+            LOGGER.info("Saved the PDF ledger to %s.", pdf_filepath)
+        return pdf_filepath
+
+    def delete_unused_pdf_files(self) -> None:
+        """Deletes the saved PDF ledgers that are no longer needed."""
+
+        pdf_folder = self.save_data_filepath + PDF_FOLDER_SUFFIX
+        if not os.path.isdir(pdf_folder):
+            return
+
+        in_use = {self.get_pdf_filepath(ledger.pdf_file)
+                  for ledger in (self.most_recent_ledger, self.changes_ledger)
+                  if ledger is not None and isinstance(ledger.pdf_file, bytes)}
+        for filename in os.listdir(pdf_folder):
+            pdf_filepath = os.path.join(pdf_folder, filename)
+            if pdf_filepath not in in_use:
+                os.remove(pdf_filepath)
+                LOGGER.info("Deleted the unused PDF ledger %s.", pdf_filepath)
+
     def new_check_success(self, new_ledger: Ledger, changes: dict = None) -> None:
         """Runs when a check was successful.
 
@@ -125,6 +256,7 @@ class LedgerCheckerSaveFile:
 
         self.most_recent_ledger = new_ledger
         self.stack_traces.clear()
+        self.error_count = 0
         self.error_email_id = None
         self.save_data()
         LOGGER.info("Successful check saved to %s",
@@ -139,19 +271,23 @@ class LedgerCheckerSaveFile:
 
         date = datetime.now().strftime("%A %d %B %Y AT %H:%M:%S")
         self.stack_traces.append(("ERROR ON %s\n%s" % (date.upper(), stack_trace)))
+        self.error_count += 1
+
+        # Only keep the stack traces that could still be emailed
+        del self.stack_traces[:-ATTEMPTS[-1]]
         self.save_data()
         LOGGER.info("Failed check saved to %s",
                     self.save_data_filepath)
 
     def update_error_email_id(self, email_id: str) -> None:
-        """Sets and saves the ID of the last error email.
+        """Sets the ID of the last error email, to be saved later.
 
         :param email_id: the ID to save
         :type email_id: str
         """
 
         self.error_email_id = email_id
-        self.save_data()
+        self.unsaved_changes = True
 
     def get_error_email_id(self) -> Optional[str]:
         """Gets and returns the ID of the last error email, if it exists."""
@@ -159,14 +295,14 @@ class LedgerCheckerSaveFile:
         return self.error_email_id
 
     def update_success_email_id(self, email_id: str) -> None:
-        """Sets and saves the ID of the last success email.
+        """Sets the ID of the last success email, to be saved later.
 
         :param email_id: the ID to save
         :type email_id: str
         """
 
         self.success_email_id = email_id
-        self.save_data()
+        self.unsaved_changes = True
 
     def get_success_email_id(self) -> Optional[str]:
         """Gets and returns the ID of the last success email, if it exists."""
@@ -189,14 +325,69 @@ class LedgerCheckerSaveFile:
         return self.changes_ledger
 
     def get_stack_traces(self) -> list:
-        """Gets and returns the list of stack traces."""
+        """Gets and returns the list of the most recent stack traces."""
 
         return self.stack_traces
 
+    def get_error_count(self) -> int:
+        """Gets and returns the number of consecutive errors."""
+
+        return self.error_count
+
     def log(self) -> None:
         """Logs the object to the log."""
 
-        LOGGER.info(json.dumps(self.__dict__, cls=CustomEncoder))
+        if LOGGER.isEnabledFor(logging.INFO):
+            LOGGER.info(json.dumps(self.__dict__, cls=CustomEncoder))
+
+
+@lru_cache(maxsize=1024)
+def format_gbp(value: float) -> str:
+    """Formats the value as GBP, caching the result.
+
+    :param value: the value to format
+    :type value: float
+    :return: the formatted value
+    :rtype: str
+    """
+
+    # Babel is only imported here as it's only used to format money
+    # for the emails
+    from babel.numbers import format_currency
+
+    return format_currency(value, "GBP", locale="en_GB")
+
+
+@lru_cache(maxsize=1)
+def get_jinja_environment() -> "jinja2.Environment":
+    """Gets the Jinja environment used to load the email templates.
+
+    The templates are next to this script. The compiled templates are
+    cached on disk too, so they're only compiled once.
+
+    :return: the Jinja environment
+    :rtype: jinja2.Environment
+    """
+
+    # Jinja is only imported the first time an email is written
+    from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+    return Environment(loader=FileSystemLoader(os.path.dirname(os.path.abspath(__file__))),
+                       bytecode_cache=FileSystemBytecodeCache(),
+                       auto_reload=False)
+
+
+@lru_cache(maxsize=2)
+def get_email_template(filename: str) -> "jinja2.Template":
+    """Gets an email template, loading it the first time.
+
+    :param filename: the filename of the template
+    :type filename: str
+    :return: the email template
+    :rtype: jinja2.Template
+    """
+
+    return get_jinja_environment().get_template(filename)
 
 
 def prepare_email_body(changes: dict, sheet_url: str, pdf_url: str,
@@ -219,52 +410,40 @@ def prepare_email_body(changes: dict, sheet_url: str, pdf_url: str,
 
     # Remove the cost codes with no change
     LOGGER.info("Creating the email...")
-    for name, value in changes["costCodes"].copy().items():
-        if value["changeInBalance"] == 0:
-            changes["costCodes"].pop(name)
-
-    # Calculate a grand total change
-    changes["grandTotal"]["changeInTotalBalance"] = 0
-    for name, value in changes["costCodes"].items():
-        changes["grandTotal"]["changeInTotalBalance"] += value["changeInBalance"]
+    changes["costCodes"] = {name: value for name, value
+                            in changes["costCodes"].items()
+                            if value["changeInBalance"] != 0}
 
-    # Format all of the money values in each cost code
+    # Calculate a grand total change and format all of the money values
+    # in each cost code, in one pass
+    change_in_total_balance = 0
     cost_code_items = ["balance", "changeInBalance", "moneyIn", "moneyOut"]
-    for name, value in changes["costCodes"].items():
+    for value in changes["costCodes"].values():
+        change_in_total_balance += value["changeInBalance"]
 
         # For the cost code totals
         for item in cost_code_items:
-            changes["costCodes"][name][item] = \
-                format_currency(value[item], "GBP", locale="en_GB")
+            value[item] = format_gbp(value[item])
 
         # For each entry in the cost code
-        for i in range(0, len(value["entries"])):
-            changes["costCodes"][name]["entries"][i]["money"] = \
-                format_currency(changes["costCodes"][name]["entries"][i]["money"],
-                                "GBP", locale="en_GB")
+        for entry in value["entries"]:
+            entry["money"] = format_gbp(entry["money"])
+    changes["grandTotal"]["changeInTotalBalance"] = change_in_total_balance
 
     # Format the grand total values
     grand_total_items = ["balanceBroughtForward", "totalIn", "totalBalance",
                          "totalOut", "changeInTotalBalance"]
     for item in grand_total_items:
-        changes["grandTotal"][item] = \
-            format_currency(changes["grandTotal"][item], "GBP", locale="en_GB")
-
-    # Render the template
-    root = os.path.dirname(os.path.abspath(__file__))
-    env = Environment(loader=FileSystemLoader(root))
-    template = env.get_template("email-template.html")
-    html = template.render(changes=changes,
-                           sheet_url=sheet_url,
-                           pdf_url=pdf_url,
-                           last_check=last_check,
-                           ledger_plurality=ledger_plurality)
-
-    # Create the plain-text version of the message
-    text_maker = html2text.HTML2Text()
-    text_maker.ignore_links = True
-    text_maker.bypass_tables = False
-    text = text_maker.handle(html)
+        changes["grandTotal"][item] = format_gbp(changes["grandTotal"][item])
+
+    # Render the HTML and plain-text templates
+    template_args = {"changes": changes,
+                     "sheet_url": sheet_url,
+                     "pdf_url": pdf_url,
+                     "last_check": last_check,
+                     "ledger_plurality": ledger_plurality}
+    html = get_email_template("email-template.html").render(**template_args)
+    text = get_email_template("email-template.txt").render(**template_args)
     LOGGER.info("Email HTML and plain-text created successfully.")
 
     return text, html
@@ -287,16 +466,21 @@ def send_success_email(config: configparser.SectionProxy,
     :type old_ledger: Ledger
     """
 
-    message = MIMEMultipart("alternative")
+    message = EmailMessage()
     message["Subject"] = changes["societyName"] + " Ledger Update"
     message["To"] = config["to"]
     message["From"] = config["from"]
-    if save_data.get_changes() is not None and \
-            changes["oldLedgerTimestamp"] == save_data.get_changes()["oldLedgerTimestamp"]:
-        message["In-Reply-To"] = save_data.get_success_email_id()
+    previous_changes = save_data.get_changes()
+    previous_email_id = save_data.get_success_email_id()
+    if previous_changes is not None and previous_email_id is not None and \
+            changes["oldLedgerTimestamp"] == previous_changes["oldLedgerTimestamp"]:
+        message["In-Reply-To"] = previous_email_id
 
     # Prepare the email
     if old_ledger is not None:
+        # timeago is only used here, to say how long ago the last
+        # check was
+        import timeago
         old_timestamp = old_ledger.get_timestamp()
         new_timestamp = new_ledger.get_timestamp()
         last_check = " since the last check %s on %s" % (timeago.format(old_timestamp.replace(tzinfo=None),
@@ -315,42 +499,15 @@ def send_success_email(config: configparser.SectionProxy,
                                     last_check=last_check,
                                     ledger_plurality=ledger_plurality)
 
-    # Turn these into plain/html MIMEText objects
-    # Add HTML/plain-text parts to MIMEMultipart message
+    # Add the plain-text and HTML versions of the message
     # The email client will try to render the last part first
-    message.attach(MIMEText(text, "plain"))
-    message.attach(MIMEText(html, "html"))
-
-    # Attach the new ledger
-    part = MIMEBase("application", "pdf")
-    part.set_payload(new_ledger.get_pdf_file())
-    encoders.encode_base64(part)
-    part.add_header("Content-Disposition",
-                    "attachment; filename=\"NEW %s\"; creation-date=\"%s\"; "
-                    "modification-date=\"%s\"; read-date=\"%s\"" %
-                    (new_ledger.get_pdf_filename(),
-                     email.utils.format_datetime(new_ledger.get_timestamp()),
-                     email.utils.format_datetime(new_ledger.get_timestamp()),
-                     email.utils.format_datetime(new_ledger.get_timestamp())))
-    part.add_header("Content-Description",
-                    "NEW %s" % new_ledger.get_pdf_filename())
-    message.attach(part)
-
-    # Attach the old ledger if it exists
+    message.set_content(text, cte="quoted-printable")
+    message.add_alternative(html, subtype="html", cte="quoted-printable")
+
+    # Attach the new ledger, and the old ledger if it exists
+    attach_ledger(message=message, ledger=new_ledger, label="NEW")
     if old_ledger is not None:
-        part = MIMEBase("application", "pdf")
-        part.set_payload(old_ledger.get_pdf_file())
-        encoders.encode_base64(part)
-        part.add_header("Content-Disposition",
-                        "attachment; filename=\"OLD %s\"; creation-date=\"%s\"; "
-                        "modification-date=\"%s\"; read-date=\"%s\"" %
-                        (old_ledger.get_pdf_filename(),
-                         email.utils.format_datetime(old_ledger.get_timestamp()),
-                         email.utils.format_datetime(old_ledger.get_timestamp()),
-                         email.utils.format_datetime(old_ledger.get_timestamp())))
-        part.add_header("Content-Description",
-                        "OLD %s" % old_ledger.get_pdf_filename())
-        message.attach(part)
+        attach_ledger(message=message, ledger=old_ledger, label="OLD")
 
     # Send the email and save the ID
     save_data.update_success_email_id(send_email(config=config, message=message))
@@ -367,20 +524,18 @@ def send_error_email(config: configparser.SectionProxy,
     """
 
     # Get the count of errors and stack traces
-    error_count = len(save_data.get_stack_traces())
-    stack_traces = ""
-    for error in save_data.get_stack_traces():
-        stack_traces += error
-        stack_traces += "\n\n"
+    error_count = save_data.get_error_count()
+    stack_traces = "".join(error + "\n\n" for error in save_data.get_stack_traces())
 
     # Create the message
-    message = MIMEMultipart("alternative")
+    message = EmailMessage()
     message["Subject"] = "ERROR with ledger_checker.py!"
     message["To"] = config["to"]
     message["From"] = config["from"]
     message["X-Priority"] = "1"
-    if save_data.get_error_email_id() is not None:
-        message["In-Reply-To"] = save_data.get_error_email_id()
+    previous_email_id = save_data.get_error_email_id()
+    if previous_email_id is not None:
+        message["In-Reply-To"] = previous_email_id
 
     # Prepare the email
     if error_count >= ATTEMPTS[-1]:
@@ -396,8 +551,9 @@ def send_error_email(config: configparser.SectionProxy,
                 break
 
     # Find out when the most recent successful check was (if ever)
-    if save_data.get_most_recent_ledger() is not None:
-        most_recent = save_data.get_most_recent_ledger() \
+    most_recent_ledger = save_data.get_most_recent_ledger()
+    if most_recent_ledger is not None:
+        most_recent = most_recent_ledger \
             .get_timestamp().strftime("%A %d %B %Y at %H:%M:%S")
     else:
         most_recent = "never"
@@ -413,19 +569,56 @@ def send_error_email(config: configparser.SectionProxy,
                                                    most_recent,
                                                    future_attempts,
                                                    stack_traces))
-    message.attach(MIMEText(text, "plain"))
+    message.set_content(text, cte="quoted-printable")
 
     # Send the email and save the ID
     save_data.update_error_email_id(send_email(config=config, message=message))
 
 
-def send_email(config: configparser.SectionProxy, message: MIMEMultipart) -> str:
+def attach_ledger(message: EmailMessage, ledger: Ledger, label: str) -> None:
+    """Attaches the PDF ledger to the message.
+
+    :param message: the message to attach the ledger to
+    :type message: EmailMessage
+    :param ledger: the ledger to attach
+    :type ledger: Ledger
+    :param label: the label to put before the filename, e.g. NEW
+    :type label: str
+    """
+
+    filename = "%s %s" % (label, ledger.get_pdf_filename())
+    message.add_attachment(ledger.get_pdf_file(), maintype="application",
+                           subtype="pdf", filename=filename)
+
+    # Add the dates and description to the attachment
+    part = message.get_payload()[-1]
+    date = email.utils.format_datetime(ledger.get_timestamp())
+    for param in ("creation-date", "modification-date", "read-date"):
+        part.set_param(param, date, header="Content-Disposition")
+    part["Content-Description"] = filename
+
+
+@lru_cache(maxsize=1)
+def get_ssl_context() -> ssl.SSLContext:
+    """Gets the SSL context for the SMTP and IMAP connections.
+
+    It's only created when an email is sent, so the CA certificates
+    aren't loaded on the checks that don't send one.
+
+    :return: the SSL context
+    :rtype: ssl.SSLContext
+    """
+
+    return ssl.create_default_context()
+
+
+def send_email(config: configparser.SectionProxy, message: EmailMessage) -> str:
     """Sends the message using the config with SSL.
 
     :param config: the configuration for the email
     :type config: configparser.SectionProxy
     :param message: the message to send
-    :type message: MIMEMultipart
+    :type message: EmailMessage
     :return: the email ID
     :rtype: str
     """
@@ -435,32 +628,169 @@ def send_email(config: configparser.SectionProxy, message: MIMEMultipart) -> str
     email_id = email.utils.make_msgid(domain=config["smtp_host"])
     message["Message-ID"] = email_id
 
-    # Create the SMTP connection and send the email
-    LOGGER.info("Connecting to the SMTP server to send the email...")
-    with smtplib.SMTP_SSL(config["smtp_host"],
-                          int(config["smtp_port"]),
-                          context=ssl.create_default_context()) as server:
-        server.login(config["username"], config["password"])
-        LOGGER.info("Sending the email...")
-        server.sendmail(re.findall("(?<=<)\\S+(?=>)", config["from"])[0],
-                        re.findall("(?<=<)\\S+(?=>)", config["to"]),
-                        message.as_string())
+    # Serialise the message once, for both SMTP and IMAP
+    message_bytes = message.as_bytes(policy=email.policy.SMTP)
+
+    # Send the email using the SMTP connection
+    # If the server has closed it since it was checked then reconnect
+    # and try again, but only once
+    from_address = email.utils.parseaddr(config["from"])[1]
+    to_addresses = [address for _, address
+                    in email.utils.getaddresses([config["to"]])]
+    LOGGER.info("Sending the email...")
+    try:
+        get_smtp_connection(config).sendmail(from_address, to_addresses,
+                                             message_bytes)
+    except smtplib.SMTPServerDisconnected:
+        LOGGER.info("The SMTP connection was closed, reconnecting...")
+        get_smtp_connection(config, reconnect=True) \
+            .sendmail(from_address, to_addresses, message_bytes)
     LOGGER.info("Email sent successfully!")
 
     # If asked then manually save it to the Sent folder
     if config["save_to_sent"].lower() == "true":
-        LOGGER.info("Connecting to the IMAP server to save the email...")
-        with imaplib.IMAP4_SSL(config["imap_host"],
-                               int(config["imap_port"])) as server:
-            server.login(config["username"], config["password"])
-            server.append("INBOX.Sent", "\\Seen",
-                          imaplib.Time2Internaldate(time.time()),
-                          message.as_string().encode("utf8"))
+        server = get_imap_connection(config)
+        LOGGER.info("Saving the email...")
+        server.append("INBOX.Sent", "\\Seen",
+                      imaplib.Time2Internaldate(time.time()),
+                      message_bytes)
         LOGGER.info("Email saved successfully!")
 
     return email_id
 
 
+def get_smtp_connection(config: configparser.SectionProxy,
+                        reconnect: bool = False) -> smtplib.SMTP_SSL:
+    """Gets an open SMTP connection, reusing one if it's still alive.
+
+    :param config: the configuration for the email
+    :type config: configparser.SectionProxy
+    :param reconnect: whether to discard the existing connection
+    :type reconnect: bool, optional
+    :return: the logged-in SMTP connection
+    :rtype: smtplib.SMTP_SSL
+    """
+
+    key = (config["smtp_host"], int(config["smtp_port"]), config["username"])
+
+    # Check that the existing connection (if any) is still alive
+    server = SMTP_CONNECTIONS.pop(key, None)
+    if server is not None and reconnect:
+        server.close()
+    elif server is not None:
+        try:
+            if server.noop()[0] == 250:
+                SMTP_CONNECTIONS[key] = server
+                return server
+        except (smtplib.SMTPException, OSError):
+            pass
+        LOGGER.info("The SMTP connection has been lost.")
+        server.close()
+
+    # Otherwise create a new one
+    LOGGER.info("Connecting to the SMTP server...")
+    server = smtplib.SMTP_SSL(config["smtp_host"],
+                              int(config["smtp_port"]),
+                              context=get_ssl_context(),
+                              timeout=EMAIL_TIMEOUT)
+
+    # Don't leave the connection open if logging in fails
+    try:
+        server.login(config["username"], config["password"])
+    except Exception:
+        server.close()
+        raise
+    SMTP_CONNECTIONS[key] = server
+    return server
+
+
+def get_imap_connection(config: configparser.SectionProxy) -> imaplib.IMAP4_SSL:
+    """Gets an open IMAP connection, reusing one if it's still alive.
+
+    :param config: the configuration for the email
+    :type config: configparser.SectionProxy
+    :return: the logged-in IMAP connection
+    :rtype: imaplib.IMAP4_SSL
+    """
+
+    key = (config["imap_host"], int(config["imap_port"]), config["username"])
+
+    # Check that the existing connection (if any) is still alive
+    server = IMAP_CONNECTIONS.pop(key, None)
+    if server is not None:
+        try:
+            if server.noop()[0] == "OK":
+                IMAP_CONNECTIONS[key] = server
+                return server
+        except (imaplib.IMAP4.error, OSError):
+            pass
+        LOGGER.info("The IMAP connection has been lost.")
+        server.shutdown()
+
+    # Otherwise create a new one
+    LOGGER.info("Connecting to the IMAP server...")
+    server = imaplib.IMAP4_SSL(config["imap_host"], int(config["imap_port"]),
+                               ssl_context=get_ssl_context(),
+                               timeout=EMAIL_TIMEOUT)
+
+    # Don't leave the connection open if logging in fails
+    try:
+        server.login(config["username"], config["password"])
+    except Exception:
+        server.shutdown()
+        raise
+    IMAP_CONNECTIONS[key] = server
+    return server
+
+
+def close_email_connections() -> None:
+    """Closes all of the open SMTP and IMAP connections."""
+
+    for server in SMTP_CONNECTIONS.values():
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+    SMTP_CONNECTIONS.clear()
+
+    for server in IMAP_CONNECTIONS.values():
+        try:
+            server.logout()
+        except (imaplib.IMAP4.error, OSError):
+            pass
+    IMAP_CONNECTIONS.clear()
+
+
+atexit.register(close_email_connections)
+
+
+def have_same_totals(changes: dict, old_changes: dict) -> bool:
+    """Checks if the changes have the same totals as the old changes.
+
+    This compares the total income & expenditure, and the balance
+    brought forward, to the nearest penny.
+
+    :param changes: the new changes
+    :type changes: dict
+    :param old_changes: the changes from the save file
+    :type old_changes: dict
+    :return: whether the totals are the same
+    :rtype: bool
+    """
+
+    items = ("totalIn", "totalOut", "balanceBroughtForward")
+    new_totals = changes["grandTotal"]
+
+    # Older save files only have the formatted totals
+    if "rawGrandTotal" not in old_changes:
+        return all(format_gbp(new_totals[item]) == old_changes["grandTotal"][item]
+                   for item in items)
+
+    old_totals = old_changes["rawGrandTotal"]
+    return all(round(new_totals[item], 2) == round(old_totals[item], 2)
+               for item in items)
+
+
 def check_ledger(save_data: LedgerCheckerSaveFile,
                  parser: configparser.ConfigParser) -> None:
     """Runs a check of the ledger.
@@ -477,18 +807,27 @@ def check_ledger(save_data: LedgerCheckerSaveFile,
     expense365 = parser["eXpense365"]
 
     # Download the ledger, convert it, and upload it to Google Sheets
+    # Authorize access to Google in the background while converting,
+    # but only if the user doesn't need to be asked to authorize it
     print("Downloading the PDF...")
     ledger = Ledger(config=config, expense365=expense365)
-    print("Converting the ledger...")
-    ledger.get_xlsx_filepath()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        authorization = executor.submit(authorize,
+                                        pushbullet=ledger.pushbullet,
+                                        open_browser=ledger.browser_path,
+                                        interactive=False)
+        print("Converting the ledger...")
+        ledger.get_xlsx_filepath()
+    try:
+        _, _, apps_script = authorization.result()
+    except AuthorizationRequiredError:
+        _, _, apps_script = authorize(pushbullet=ledger.pushbullet,
+                                      open_browser=ledger.browser_path)
     print("Uploading the ledger to Google Sheets...")
     sheets_data = ledger.get_sheets_data()
     print("Ledger downloaded, converted, and uploaded successfully.")
 
-    # Connect to the Apps Script service and attempt to execute it
-    socket.setdefaulttimeout(600)
-    _, _, apps_script = authorize(pushbullet=ledger.pushbullet,
-                                  open_browser=ledger.browser_path)
+    # Attempt to execute the Apps Script function
     print("Executing the Apps Script function (this may take some time)...")
     LOGGER.info("Starting the Apps Script function...")
     body = {"function": "checkForNewTotals",
@@ -524,49 +863,49 @@ def check_ledger(save_data: LedgerCheckerSaveFile,
     if changes is False or changes.lower() == "false":
         print("Changes is False, so we'll do nothing.")
         LOGGER.info("Changes is False, so we'll do nothing.")
-        ledger.delete_pdf()
-        ledger.delete_xlsx()
-        ledger.delete_sheet()
-        save_data.new_check_success(new_ledger=ledger)
+        changes = None
 
     else:
         changes = json.loads(response["response"].get("result"))
 
+        # Keep the unformatted totals, as the email formats them
+        changes["rawGrandTotal"] = dict(changes["grandTotal"])
+
         # If the returned changes aren't actually new to us then
-        # just delete the new sheet we just made
+        # also do nothing
         # This compares the total income & expenditure
         if old_changes is not None and \
-                format_currency(changes["grandTotal"]["totalIn"], "GBP", locale="en_GB") == \
-                old_changes["grandTotal"]["totalIn"] and \
-                format_currency(changes["grandTotal"]["totalOut"], "GBP", locale="en_GB") == \
-                old_changes["grandTotal"]["totalOut"] and \
-                format_currency(changes["grandTotal"]["balanceBroughtForward"], "GBP", locale="en_GB") \
-                == old_changes["grandTotal"]["balanceBroughtForward"]:
+                have_same_totals(changes=changes, old_changes=old_changes):
             print("The new changes is the same as the old.")
             LOGGER.info("The new changes is the same as the old.")
-            ledger.delete_pdf()
-            ledger.delete_xlsx()
-            ledger.delete_sheet()
-            save_data.new_check_success(new_ledger=ledger)
-
-        # Otherwise these changes are new
-        # Update the PDF ledger in the user's Google Drive
-        # Notify the user (via email) and hide the old sheet
-        # Save the new data to the save file
-        else:
-            print("We have some new changes!")
-            LOGGER.info("We have some new changes.")
-            ledger.update_drive_pdf()
-            send_success_email(config=parser["email"],
-                               save_data=save_data,
-                               changes=changes,
-                               new_ledger=ledger,
-                               old_ledger=save_data.get_most_recent_ledger())
-            print("Email sent successfully!")
-            LOGGER.info("Hiding the old sheet...")
-            if save_data.get_changes_ledger() is not None:
-                save_data.get_changes_ledger().hide_sheet()
-            save_data.new_check_success(new_ledger=ledger, changes=changes)
+            changes = None
+
+    # If there's nothing new then just delete the new ledger and the
+    # new sheet we just made
+    if changes is None:
+        ledger.delete_pdf()
+        ledger.delete_xlsx()
+        ledger.delete_sheet()
+        save_data.new_check_success(new_ledger=ledger)
+
+    # Otherwise these changes are new
+    # Update the PDF ledger in the user's Google Drive
+    # Notify the user (via email) and hide the old sheet
+    # Save the new data to the save file
+    else:
+        print("We have some new changes!")
+        LOGGER.info("We have some new changes.")
+        ledger.update_drive_pdf()
+        send_success_email(config=parser["email"],
+                           save_data=save_data,
+                           changes=changes,
+                           new_ledger=ledger,
+                           old_ledger=save_data.get_most_recent_ledger())
+        print("Email sent successfully!")
+        LOGGER.info("Hiding the old sheet...")
+        if save_data.get_changes_ledger() is not None:
+            save_data.get_changes_ledger().hide_sheet()
+        save_data.new_check_success(new_ledger=ledger, changes=changes)
 
 
 def main() -> None:
@@ -579,18 +918,16 @@ def main() -> None:
     LOGGER.info("\n")
 
     # Check that the config file exists
-    try:
-        open(CONFIG_FILENAME, "rb")
-        LOGGER.info("Loaded config %s.", CONFIG_FILENAME)
-    except FileNotFoundError as e:
+    if not os.path.isfile(CONFIG_FILENAME):
         print("The config file doesn't exist!")
         LOGGER.info("Could not find config %s, exiting.", CONFIG_FILENAME)
         time.sleep(5)
-        raise FileNotFoundError("The config file doesn't exist!") from e
+        raise FileNotFoundError("The config file doesn't exist!")
+    LOGGER.info("Loaded config %s.", CONFIG_FILENAME)
 
     # Fetch info from the config
-    parser = configparser.ConfigParser()
-    parser.read(CONFIG_FILENAME)
+    parser = load_config(CONFIG_FILENAME,
+                         os.stat(CONFIG_FILENAME).st_mtime_ns)
 
     save_data = LedgerCheckerSaveFile(parser["ledger_checker"]["save_data_filepath"])
 
@@ -601,14 +938,17 @@ def main() -> None:
         traceback.print_exc()
         LOGGER.exception("That check went wrong!")
         LOGGER.error("This is consecutive failed attempt no. %d.",
-                     len(save_data.get_stack_traces()))
+                     save_data.get_error_count())
         print("This is consecutive error number %d"
-              % len(save_data.get_stack_traces()))
+              % save_data.get_error_count())
 
-        if len(save_data.get_stack_traces()) in ATTEMPTS:
+        if save_data.get_error_count() in ATTEMPTS:
             send_error_email(config=parser["email"], save_data=save_data)
             print("Email sent successfully!")
 
+    # Save the ID of any email that was sent since the last save
+    save_data.save_unsaved_changes()
+
     time.sleep(5)
 
 
@@ -619,9 +959,5 @@ if __name__ == "__main__":
                         filemode="a",
                         format="%(asctime)s | %(levelname)s : %(message)s",
                         level=logging.INFO)
-    LOGGER = logging.getLogger(__name__)
 
     main()
-
-else:
-    LOGGER = logging.getLogger(__name__)
@@ -36,45 +36,57 @@ Before running this script, make sure you've got a valid config file
 and a valid set of credentials (saved to config.ini and
 credentials.json respectively).
 
-This script relies on the classes in custom_exceptions.py.
+This script relies on the classes in custom_exceptions.py and the
+config loader in config_cache.py.
 """
 
-from __future__ import print_function
-
+import atexit
 import base64
 import configparser
+import io
 import json
 import logging
 import os
 import pathlib
 import pickle
 import shutil
+import threading
 import time
 import traceback
 import webbrowser
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from tkinter import filedialog
 from typing import Optional, Union
 
-import camelot
+import httplib2
 import pyperclip
 import requests
 from appJar import gui
-from dateutil import tz
 from func_timeout import func_set_timeout, FunctionTimedOut
 from google.auth.exceptions import RefreshError
 from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
 from pushbullet import InvalidKeyError, Pushbullet, PushError
-from pyexcel.cookbook import merge_csv_to_a_book
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+from config_cache import load_config
 from custom_exceptions import *
 
 __author__ = "Christopher Menon"
 __credits__ = "Christopher Menon"
 __license__ = "gpl-3.0"
 
+LOGGER = logging.getLogger(__name__)
+
 # The name of the config file
 CONFIG_FILENAME = "config.ini"
 
@@ -92,11 +104,60 @@ SCOPES = ["https://www.googleapis.com/auth/spreadsheets",
 # How long to wait for authorization (in seconds)
 AUTHORIZATION_TIMEOUT = 300
 
+# How long to wait for a response from Drive and Sheets (in seconds)
+GOOGLE_API_TIMEOUT = 60
+
+# How long to wait for an Apps Script function to finish (in seconds)
+APPS_SCRIPT_TIMEOUT = 600
+
 # This file stores the user's access and refresh tokens and is created
 # automatically when the authorization flow completes for the first
 # time. This specifies where the file is stored
+TOKEN_FILE = "token.json"
+
+# This is where the tokens used to be stored, before they were saved as
+# JSON. If it exists then it's migrated to TOKEN_FILE
 TOKEN_PICKLE_FILE = "token.pickle"
 
+# How long to wait when connecting to and reading from eXpense365 (in
+# seconds)
+EXPENSE365_TIMEOUT = (5, 30)
+
+# The size of the chunks that the PDF is downloaded in (in bytes)
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# The size of the buffer used when saving the ledger (in bytes)
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Files larger than this are uploaded to Drive in chunks, and smaller
+# ones are uploaded in a single request (in bytes)
+RESUMABLE_UPLOAD_THRESHOLD = 5 * 1024 * 1024
+
+# How to retry failed requests to eXpense365. Generating the ledger
+# doesn't change anything so the POST request is safe to retry
+EXPENSE365_RETRIES = Retry(total=3, backoff_factor=0.5,
+                           status_forcelist=(429, 500, 502, 503, 504),
+                           allowed_methods=frozenset(["POST"]),
+                           raise_on_status=False)
+
+# The session used to make all the requests to eXpense365, which keeps
+# the connection alive between requests
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4,
+                                      max_retries=EXPENSE365_RETRIES))
+SESSION.headers.update({
+    "User-Agent": "eXpense365|1.6.1|Google Pixel XL|Android|10|en_GB",
+    "Accept": "application/json",
+    "If-Modified-Since": "Mon, 1 Oct 1990 05:00:00 GMT",
+    "Content-Type": "text/plain;charset=UTF-8",
+})
+atexit.register(SESSION.close)
+
+# The credentials and Google API services from the last authorization,
+# which are reused while the credentials are still valid
+AUTHORIZED = {"credentials": None, "services": None}
+AUTHORIZATION_LOCK = threading.Lock()
+
 
 class CustomEncoder(json.JSONEncoder):
     """Represents a custom JSON encoder."""
@@ -139,10 +200,12 @@ class Ledger:
         data = expense365["email"] + ":" + expense365["password"]
         self.auth = "Basic " + str(base64.b64encode(data.encode("utf-8")).decode())
 
+        # Prepare the request body, which doesn't change
+        self.expense365_body = json.dumps({"ReportID": int(expense365["report_id"]),
+                                           "UserGroupID": int(expense365["group_id"]),
+                                           "SubGroupID": int(expense365["subgroup_id"])})
+
         # Download the ledger
-        self.expense365_data = {"ReportID": int(expense365["report_id"]),
-                                "UserGroupID": int(expense365["group_id"]),
-                                "SubGroupID": int(expense365["subgroup_id"])}
         self.filename_prefix = config["filename_prefix"]
         self.dir_name = config["dir_name"]
         self.pushbullet = {"access_token": config["pushbullet_access_token"],
@@ -180,40 +243,42 @@ class Ledger:
 
         # Prepare the request
         url = "https://service.expense365.com/ws/rest/eXpense365/RequestDocument"
-        headers = {
-            "Host": "service.expense365.com:443",
-            "User-Agent": "eXpense365|1.6.1|Google Pixel XL|Android|10|en_GB",
-            "Authorization": self.auth,
-            "Accept": "application/json",
-            "If-Modified-Since": "Mon, 1 Oct 1990 05:00:00 GMT",
-            "Content-Type": "text/plain;charset=UTF-8",
-        }
+        headers = {"Authorization": self.auth}
 
         # Make the request and check it was successful
         LOGGER.info("Making the HTTP request to service.expense365.com...")
-        response = requests.post(url=url, headers=headers,
-                                 data=json.dumps(self.expense365_data))
+        response = SESSION.post(url=url, headers=headers,
+                                data=self.expense365_body,
+                                timeout=EXPENSE365_TIMEOUT, stream=True)
         response.raise_for_status()
         LOGGER.info("The request was successful with no HTTP errors.")
 
         # Save the date and convert it to the local timezone
-        self.timestamp = datetime.strptime(response.headers["Date"],
-                                           "%a, %d %b %Y %H:%M:%S %Z") \
-            .replace(tzinfo=tz.tzutc()) \
-            .astimezone(tz.tzlocal())
+        self.timestamp = parsedate_to_datetime(response.headers["Date"]).astimezone()
 
         # Parse the date as a string
         date_string = self.get_timestamp().strftime("%d-%m-%Y at %H.%M.%S")
 
+        # Read the PDF in one go if we know its size, otherwise read it
+        # in large chunks rather than the small ones that response.content
+        # uses
+        chunk_size = int(response.headers.get("Content-Length", 0)) or DOWNLOAD_CHUNK_SIZE
+        with response:
+            self.pdf_file = b"".join(response.iter_content(chunk_size=chunk_size))
+
         # Save the file
         self.pdf_filename = self.filename_prefix + " " + date_string + ".pdf"
-        self.pdf_file = response.content
         if save is True:
             self.save_pdf()
 
     def convert_to_xlsx(self) -> None:
         """Converts the PDF to an Excel file and saves it."""
 
+        # camelot and pyexcel take a while to load, so they're only
+        # imported when a ledger is actually converted
+        import camelot
+        from pyexcel.cookbook import merge_csv_to_a_book
+
         # Convert the PDF
         tables = camelot.read_pdf(self.get_pdf_filepath(),
                                   columns=["88.2,430.4,504.6"],
@@ -234,24 +299,27 @@ class Ledger:
         LOGGER.info("Saving the CSV files to %s", filepath)
         tables.export(filepath, f="csv")
 
-        # Combine the CSV files into one
-        with open(os.path.join(path, "combined.csv"), "w") as combined_file:
+        # Combine the CSV files into one, streaming each page across
+        exported = set(os.listdir(path))
+        combined_filepath = os.path.join(path, "combined.csv")
+        with open(combined_filepath, "wb",
+                  buffering=WRITE_BUFFER_SIZE) as combined_file:
             table = 1
             while True:
                 filename = "result-page-%d-table-1.csv" % table
-                if filename in os.listdir(path):
-                    with open(os.path.join(path, filename)) as table_file:
-                        combined_file.write(table_file.read())
-                        LOGGER.info("Wrote %s to %s.", os.path.join(path, filename),
-                                    os.path.join(path, "combined.csv"))
-                else:
+                if filename not in exported:
                     break
+                with open(os.path.join(path, filename), "rb") as table_file:
+                    shutil.copyfileobj(table_file, combined_file,
+                                       WRITE_BUFFER_SIZE)
+                LOGGER.info("Wrote %s to %s.", os.path.join(path, filename),
+                            combined_filepath)
                 table += 1
 
         # Convert the CSV to an XLSX and save it
         self.xlsx_filename = self.get_pdf_filename().replace(".pdf", ".xlsx")
         self.xlsx_filepath = self.dir_name + self.xlsx_filename
-        merge_csv_to_a_book([os.path.join(path, "combined.csv")],
+        merge_csv_to_a_book([combined_filepath],
                             self.xlsx_filepath)
         with open(self.xlsx_filepath, "rb") as xlsx_file:
             self.xlsx_file = xlsx_file.read()
@@ -279,9 +347,10 @@ class Ledger:
         file_metadata = {"name": self.pdf_ledger_name,
                          "mimeType": "application/pdf",
                          "originalFilename": self.get_pdf_filename()}
-        media = MediaFileUpload(self.get_pdf_filepath(save=save),
-                                mimetype="application/pdf",
-                                resumable=True)
+        pdf_file = self.get_pdf_file()
+        media = MediaIoBaseUpload(io.BytesIO(pdf_file),
+                                  mimetype="application/pdf",
+                                  resumable=len(pdf_file) > RESUMABLE_UPLOAD_THRESHOLD)
         file = drive.files().update(body=file_metadata,
                                     media_body=media,
                                     fields="webViewLink",
@@ -315,10 +384,10 @@ class Ledger:
                          "mimeType": "application/vnd.google-apps.spreadsheet"}
         xlsx_mimetype = ("application/vnd.openxmlformats-officedocument" +
                          ".spreadsheetml.sheet")
-        media = MediaFileUpload(self.get_xlsx_filepath(convert=convert,
-                                                       save=save),
-                                mimetype=xlsx_mimetype,
-                                resumable=True)
+        xlsx_file = self.get_xlsx_file(convert=convert)
+        media = MediaIoBaseUpload(io.BytesIO(xlsx_file),
+                                  mimetype=xlsx_mimetype,
+                                  resumable=len(xlsx_file) > RESUMABLE_UPLOAD_THRESHOLD)
         file = drive.files().create(body=file_metadata,
                                     media_body=media,
                                     fields="id").execute()
@@ -326,22 +395,39 @@ class Ledger:
         LOGGER.info("Ledger uploaded to Google Sheets with file ID %s.",
                     latest_ledger_id)
 
-        # Get the ID of the first sheet in the newly-uploaded spreadsheet
-        LOGGER.info("Fetching the sheet ID...")
-        response = sheets.spreadsheets().get(spreadsheetId=latest_ledger_id,
-                                             ranges="A1:D4",
-                                             includeGridData=False).execute()
-        sheet_id = response["sheets"][0]["properties"]["sheetId"]
+        # The first sheet of a converted XLSX normally has the ID 0
+        sheet_id = 0
         LOGGER.info("The ledger is in the sheet with ID %s.", sheet_id)
 
         # Copy the uploader ledger to the sheet with the macro
         LOGGER.info("Copying the sheet to the spreadsheet with ID %s...",
                     self.destination_spreadsheet_id)
         body = {"destinationSpreadsheetId": self.destination_spreadsheet_id}
-        response = sheets.spreadsheets().sheets() \
-            .copyTo(spreadsheetId=latest_ledger_id,
-                    sheetId=sheet_id,
-                    body=body).execute()
+        try:
+            response = sheets.spreadsheets().sheets() \
+                .copyTo(spreadsheetId=latest_ledger_id,
+                        sheetId=sheet_id,
+                        body=body,
+                        fields="sheetId").execute()
+
+        # If the sheet ID was wrong then fetch it and try again
+        # Any other error is raised as normal
+        except HttpError as e:
+            if e.resp.status != 400:
+                raise
+            LOGGER.warning("Failed to copy the sheet with ID %s, fetching "
+                           "the sheet ID...", sheet_id)
+            response = sheets.spreadsheets().get(spreadsheetId=latest_ledger_id,
+                                                 ranges="A1:D4",
+                                                 includeGridData=False,
+                                                 fields="sheets.properties.sheetId").execute()
+            sheet_id = response["sheets"][0]["properties"]["sheetId"]
+            LOGGER.info("The ledger is in the sheet with ID %s.", sheet_id)
+            response = sheets.spreadsheets().sheets() \
+                .copyTo(spreadsheetId=latest_ledger_id,
+                        sheetId=sheet_id,
+                        body=body,
+                        fields="sheetId").execute()
         new_sheet_id = response["sheetId"]
         LOGGER.info("Sheet copied successfully. Sheet has ID %s.",
                     new_sheet_id)
@@ -531,10 +617,7 @@ class Ledger:
         if self.browser_path is False:
             print("View the PDF ledger here: %s" % open_path)
         else:
-            webbrowser.register("my-browser",
-                                None,
-                                webbrowser.BackgroundBrowser(self.browser_path))
-            webbrowser.get(using="my-browser").open(open_path)
+            get_browser(self.browser_path).open(open_path)
 
     def open_sheet_in_browser(self, convert: bool = True, save: bool = True,
                               upload: bool = True) -> None:
@@ -553,10 +636,7 @@ class Ledger:
         if self.browser_path is False:
             print("Visit the Google Sheet here: %s" % open_path)
         else:
-            webbrowser.register("my-browser",
-                                None,
-                                webbrowser.BackgroundBrowser(self.browser_path))
-            webbrowser.get(using="my-browser").open(open_path)
+            get_browser(self.browser_path).open(open_path)
 
     def save_pdf(self, use_gui: bool = True) -> None:
         """Save the PDF ledger to the file.
@@ -570,28 +650,26 @@ class Ledger:
         # Find out where the user wants to save the PDF
         filename = self.get_pdf_filename().replace(".pdf", "")
         if self.app_gui is not None and use_gui is True:
-            pdf_file_box = self.app_gui.saveBox("Save ledger",
-                                                dirName=self.dir_name,
-                                                fileName=filename,
-                                                fileExt=".pdf",
-                                                fileTypes=[("PDF file", "*.pdf")],
-                                                asFile=True)
-            if pdf_file_box is None:
+            pdf_filepath = filedialog.asksaveasfilename(title="Save ledger",
+                                                        initialdir=self.dir_name,
+                                                        initialfile=filename,
+                                                        defaultextension=".pdf",
+                                                        filetypes=[("PDF file", "*.pdf")])
+            if not pdf_filepath:
                 LOGGER.warning("The user cancelled saving the PDF.")
                 raise SystemExit("User cancelled saving the PDF.")
 
             # Update the attributes to the new location
-            self.pdf_filepath = pdf_file_box.name
+            self.pdf_filepath = pdf_filepath
             _, filename = os.path.split(self.pdf_filepath)
             self.pdf_filename = filename
-            self.app_gui.removeAllWidgets()
 
         # Otherwise just use the default location
         else:
             self.pdf_filepath = self.dir_name + self.get_pdf_filename()
 
         # Save it
-        with open(self.pdf_filepath, "wb") as pdf_file:
+        with open(self.pdf_filepath, "wb", buffering=WRITE_BUFFER_SIZE) as pdf_file:
             pdf_file.write(self.pdf_file)
         LOGGER.info("PDF saved to %s successfully", self.pdf_filepath)
 
@@ -609,28 +687,26 @@ class Ledger:
         # Find out where the user wants to save the XLSX
         filename = self.get_xlsx_filename(convert=convert).replace(".xlsx", "")
         if self.app_gui is not None and use_gui is True:
-            xlsx_file_box = self.app_gui.saveBox("Save ledger",
-                                                 dirName=self.dir_name,
-                                                 fileName=filename,
-                                                 fileExt=".xlsx",
-                                                 fileTypes=[("XLSX Spreadsheet", "*.xlsx")],
-                                                 asFile=True)
-            if xlsx_file_box is None:
+            xlsx_filepath = filedialog.asksaveasfilename(title="Save ledger",
+                                                         initialdir=self.dir_name,
+                                                         initialfile=filename,
+                                                         defaultextension=".xlsx",
+                                                         filetypes=[("XLSX Spreadsheet", "*.xlsx")])
+            if not xlsx_filepath:
                 LOGGER.warning("The user cancelled saving the XLSX.")
                 raise SystemExit("User cancelled saving the XLSX.")
 
             # Update the attributes to the new location
-            self.xlsx_filepath = xlsx_file_box.name
+            self.xlsx_filepath = xlsx_filepath
             _, filename = os.path.split(self.xlsx_filepath)
             self.xlsx_filename = filename
-            self.app_gui.removeAllWidgets()
 
         # Otherwise just use the default location
         else:
             self.xlsx_filepath = self.dir_name + self.get_xlsx_filename(convert=convert)
 
         # Save it
-        with open(self.xlsx_filepath, "wb") as xlsx_file:
+        with open(self.xlsx_filepath, "wb", buffering=WRITE_BUFFER_SIZE) as xlsx_file:
             xlsx_file.write(self.get_xlsx_file(convert=convert))
         LOGGER.info("XLSX saved to %s successfully", self.xlsx_filepath)
 
@@ -703,25 +779,36 @@ class Ledger:
     def log(self) -> None:
         """Logs the object to the log."""
 
-        LOGGER.info(json.dumps(self.__dict__, cls=CustomEncoder))
+        if LOGGER.isEnabledFor(logging.INFO):
+            LOGGER.info(json.dumps(self.__dict__, cls=CustomEncoder))
 
 
 def authorize(pushbullet: dict,
-              open_browser: Optional[Union[bool, str]] = True) -> tuple:
+              open_browser: Optional[Union[bool, str]] = True,
+              interactive: bool = True) -> tuple:
     """Authorizes access to the user's Drive, Sheets, and Apps Script.
 
     :param pushbullet: the configuration for Pushbullet
     :type pushbullet: dict
     :param open_browser: whether to open the browser
     :type open_browser: Optional[Union[bool, str]]
+    :param interactive: whether the user can be asked to authorize it
+    :type interactive: bool, optional
     :return: the authenticated services
     :rtype: tuple
+    :raises AuthorizationRequiredError: if the user needs to authorize
+        it but interactive is False
     """
 
     @func_set_timeout(AUTHORIZATION_TIMEOUT)
     def authorize_in_browser():
         """Authorize in the browser, with a timeout."""
 
+        # Don't prompt the user if they can't be asked right now
+        if interactive is False:
+            raise AuthorizationRequiredError("The user needs to authorize "
+                                             "access to Google APIs.")
+
         if open_browser is False:
             # Tell the user to go and authorize it themselves
             flow = InstalledAppFlow.from_client_secrets_file(
@@ -745,52 +832,96 @@ def authorize(pushbullet: dict,
             print("Your browser should open automatically.")
             return flow.run_local_server(port=0)
 
-    LOGGER.info("Authenticating the user to access Google APIs...")
-    credentials = None
-    if os.path.exists(TOKEN_PICKLE_FILE):
-        with open(TOKEN_PICKLE_FILE, "rb") as token:
-            credentials = pickle.load(token)
-
-    # If there are no (valid) credentials available, let the user log in.
-    if not credentials or not credentials.valid:
-        LOGGER.info("There are no credentials or they are invalid.")
-        if credentials and credentials.refresh_token:
-            try:
-                credentials.refresh(Request())
-            except RefreshError:
-                os.remove(TOKEN_PICKLE_FILE)
-
+    # Only let one thread authorize at a time, so the others can reuse
+    # the services that it builds
+    with AUTHORIZATION_LOCK:
+        # Reuse the services if the credentials are still valid
+        if AUTHORIZED["credentials"] is not None and \
+                AUTHORIZED["credentials"].valid:
+            LOGGER.info("Reusing the existing Google API services.")
+            return AUTHORIZED["services"]
+
+        LOGGER.info("Authenticating the user to access Google APIs...")
+        credentials = None
+        token_file = None
+        if os.path.exists(TOKEN_FILE):
+            token_file = TOKEN_FILE
+            credentials = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+        elif os.path.exists(TOKEN_PICKLE_FILE):
+            token_file = TOKEN_PICKLE_FILE
+            credentials = pickle.loads(pathlib.Path(TOKEN_PICKLE_FILE).read_bytes())
+
+        # If there are no (valid) credentials available, let the user log in.
+        if not credentials or not credentials.valid:
+            LOGGER.info("There are no credentials or they are invalid.")
+            if credentials and credentials.refresh_token:
+                try:
+                    credentials.refresh(Request())
+                except RefreshError:
+                    os.remove(token_file)
+
+                    try:
+                        credentials = authorize_in_browser()
+                    except FunctionTimedOut as e:
+                        raise FunctionTimedOut("Waited %d seconds to authorize Google APIs." %
+                                               AUTHORIZATION_TIMEOUT) from e
+            else:
                 try:
                     credentials = authorize_in_browser()
                 except FunctionTimedOut as e:
                     raise FunctionTimedOut("Waited %d seconds to authorize Google APIs." %
                                            AUTHORIZATION_TIMEOUT) from e
-        else:
-            try:
-                credentials = authorize_in_browser()
-            except FunctionTimedOut as e:
-                raise FunctionTimedOut("Waited %d seconds to authorize Google APIs." %
-                                       AUTHORIZATION_TIMEOUT) from e
 
-    # If we do have valid credentials then refresh them
-    else:
-        credentials.refresh(Request())
-
-    # Save the credentials for the next run
-    with open(TOKEN_PICKLE_FILE, "wb") as token:
-        pickle.dump(credentials, token)
-    LOGGER.info("Credentials saved to %s successfully.",
-                TOKEN_PICKLE_FILE)
+        # If we do have valid credentials then refresh them
+        else:
+            credentials.refresh(Request())
+
+        # Save the credentials for the next run, writing to a temporary
+        # file first so that a crash can't leave a half-written token
+        pathlib.Path(TOKEN_FILE + ".tmp").write_text(credentials.to_json())
+        os.replace(TOKEN_FILE + ".tmp", TOKEN_FILE)
+        LOGGER.info("Credentials saved to %s successfully.", TOKEN_FILE)
+        if os.path.exists(TOKEN_PICKLE_FILE):
+            os.remove(TOKEN_PICKLE_FILE)
+            LOGGER.info("Deleted the old credentials in %s.", TOKEN_PICKLE_FILE)
+
+        # Build the services and return them as a tuple
+        # Drive and Sheets share a connection with a timeout, whilst
+        # Apps Script has a longer timeout to let the function finish
+        authorized_http = AuthorizedHttp(credentials,
+                                         http=httplib2.Http(timeout=GOOGLE_API_TIMEOUT))
+        drive_service = build("drive", "v3", http=authorized_http,
+                              cache_discovery=False)
+        sheets_service = build("sheets", "v4", http=authorized_http,
+                               cache_discovery=False)
+        apps_script_http = AuthorizedHttp(credentials,
+                                          http=httplib2.Http(timeout=APPS_SCRIPT_TIMEOUT))
+        apps_script_service = build("script", "v1", http=apps_script_http,
+                                    cache_discovery=False)
+        LOGGER.info("Services built successfully.")
+        AUTHORIZED["credentials"] = credentials
+        AUTHORIZED["services"] = (drive_service, sheets_service,
+                                  apps_script_service)
+        return AUTHORIZED["services"]
+
+
+@lru_cache(maxsize=1)
+def get_browser(browser_path: str) -> webbrowser.BaseBrowser:
+    """Registers the browser at the path and returns it.
+
+    The browser is only registered the first time that it's requested,
+    and the same controller is returned after that.
+
+    :param browser_path: the path to the browser executable
+    :type browser_path: str
+    :return: the browser controller
+    :rtype: webbrowser.BaseBrowser
+    """
 
-    # Build the services and return them as a tuple
-    drive_service = build("drive", "v3", credentials=credentials,
-                          cache_discovery=False)
-    sheets_service = build("sheets", "v4", credentials=credentials,
-                           cache_discovery=False)
-    apps_script_service = build("script", "v1", credentials=credentials,
-                                cache_discovery=False)
-    LOGGER.info("Services built successfully.")
-    return drive_service, sheets_service, apps_script_service
+    webbrowser.register("my-browser",
+                        None,
+                        webbrowser.BackgroundBrowser(browser_path))
+    return webbrowser.get(using="my-browser")
 
 
 def push_url(title: str, url: str, config: dict):
@@ -807,14 +938,18 @@ def push_url(title: str, url: str, config: dict):
     :type config: dict
     """
 
+    # Look up the config once
+    access_token = str(config["access_token"])
+    device = str(config["device"])
+
     # Stop if the user doesn't want to use Pushbullet
-    if str(config["access_token"]).lower() == "false":
+    if access_token.lower() == "false":
         return
 
     # Attempt to authenticate
     try:
         LOGGER.info("Authenticating with Pushbullet")
-        pb = Pushbullet(config["access_token"])
+        pb = Pushbullet(access_token)
         LOGGER.info("Authenticated with Pushbullet.")
     except InvalidKeyError:
         LOGGER.exception("InvalidKeyError raised when authenticating Pushbullet.")
@@ -824,17 +959,16 @@ def push_url(title: str, url: str, config: dict):
     # If successfully authenticated then attempt to push
     else:
         try:
-            if str(config["device"]).lower() == "false":
-                pb.get_device(str(config["device"])).push_link(title, url)
+            if device.lower() == "false":
+                pb.get_device(device).push_link(title, url)
                 LOGGER.info("Pushed URL %s with title %s to all devices.",
                             url, title)
                 print("The URL has been successfully pushed to all devices.")
             else:
                 pb.push_link(title, url)
                 LOGGER.info("Pushed URL %s with title %s to device %s.",
-                            url, title, config["device"])
-                print("The URL has been successfully pushed to %s." %
-                      config["device"])
+                            url, title, device)
+                print("The URL has been successfully pushed to %s." % device)
         except InvalidKeyError:
             LOGGER.exception("InvalidKeyError raised when pushing to Pushbullet.")
             print("InvalidKeyError raised when pushing to Pushbullet.")
@@ -853,18 +987,16 @@ def main(app_gui: gui) -> None:
     """
 
     # Check that the config file exists
-    try:
-        open(CONFIG_FILENAME)
-        LOGGER.info("Loaded config %s.", CONFIG_FILENAME)
-    except FileNotFoundError as e:
+    if not os.path.isfile(CONFIG_FILENAME):
         print("The config file doesn't exist!")
         LOGGER.info("Could not find config %s, exiting.", CONFIG_FILENAME)
         time.sleep(5)
-        raise FileNotFoundError("The config file doesn't exist!") from e
+        raise FileNotFoundError("The config file doesn't exist!")
+    LOGGER.info("Loaded config %s.", CONFIG_FILENAME)
 
     # Fetch info from the config
-    parser = configparser.ConfigParser()
-    parser.read(CONFIG_FILENAME)
+    parser = load_config(CONFIG_FILENAME,
+                         os.stat(CONFIG_FILENAME).st_mtime_ns)
     config = parser["ledger_fetcher"]
     expense365 = parser["eXpense365"]
 
@@ -881,19 +1013,32 @@ def main(app_gui: gui) -> None:
     if app_gui.yesNoBox("Convert to XLSX?",
                         ("Do you want to convert the PDF ledger to an XLSX " +
                          "spreadsheet, and then upload it to %s?" %
-                         config["destination_spreadsheet_name"])) is True:
+                         ledger.destination_spreadsheet_name)) is True:
 
         # If so then convert it and upload it
         LOGGER.info("User chose to convert and upload the ledger.")
-        print("Converting the ledger...")
-        ledger.convert_to_xlsx()
+
+        # Authorize access to Google in the background while converting,
+        # but only if the user doesn't need to be asked to authorize it
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            authorization = executor.submit(authorize,
+                                            pushbullet=ledger.pushbullet,
+                                            open_browser=ledger.browser_path,
+                                            interactive=False)
+            print("Converting the ledger...")
+            ledger.convert_to_xlsx()
+        try:
+            authorization.result()
+        except AuthorizationRequiredError:
+            authorize(pushbullet=ledger.pushbullet,
+                      open_browser=ledger.browser_path)
         print("Uploading the ledger to Google Sheets...")
         sheets_data = ledger.get_sheets_data()
         print("Ledger uploaded to Google Sheets successfully. "
               "Find it in the sheet named %s." % sheets_data["name"])
 
         # Ask the user if they want to open the new ledger in Google Sheets
-        if app_gui.yesNoBox("Open %s?" % config["destination_spreadsheet_name"],
+        if app_gui.yesNoBox("Open %s?" % ledger.destination_spreadsheet_name,
                             ("Do you want to open the uploaded ledger in " +
                              "Google Sheets?")) is True:
             # If so then open it in the prescribed browser
@@ -910,7 +1055,6 @@ if __name__ == "__main__":
                         filemode="a",
                         format="%(asctime)s | %(levelname)s : %(message)s",
                         level=logging.INFO)
-    LOGGER = logging.getLogger(__name__)
 
     # Create the GUI
     appjar_gui = gui(showIcon=False)
@@ -918,6 +1062,3 @@ if __name__ == "__main__":
     appjar_gui.setFont(size=12)
 
     main(appjar_gui)
-
-else:
-    LOGGER = logging.getLogger(__name__)